@@ -2,35 +2,36 @@
 from telegram import Update
 from telegram.ext import Application, CommandHandler, ContextTypes
 import telegram
-import requests
+import aiohttp
+from aiohttp import web
 import asyncio
 import os
-from typing import Optional, Dict
+from typing import Awaitable, Callable, Dict, List, NamedTuple, Optional, Tuple, TypeVar
 import logging
-from http.server import BaseHTTPRequestHandler, HTTPServer
-import threading
+from dotenv import dotenv_values
 import time
-import json
+import orjson
+import sqlite3
+import secrets
+import signal
+import threading
 
 # Configure logging
 logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
     level=logging.INFO
 )
+logger = logging.getLogger(__name__)
 
 # Secure token loading with fallback
 def get_bot_token():
+    # The environment wins; .env is only read when BOT_TOKEN is not set there
     token = os.getenv('BOT_TOKEN')
     if token:
         return token
-    try:
-        with open('.env', 'r') as f:
-            for line in f:
-                if line.startswith('BOT_TOKEN='):
-                    return line.split('=', 1)[1].strip().strip('"\'')
-    except FileNotFoundError:
-        pass
-    return None
+    if not os.path.isfile('.env'):
+        return None
+    return dotenv_values('.env').get('BOT_TOKEN') or None
 
 TOKEN = get_bot_token()
 
@@ -46,46 +47,338 @@ SUPPORTED_COINS = {
     "sol": "SOLUSDT"
 }
 
-def get_usdt_to_kgs() -> Optional[float]:
+BINANCE_PRICE_URL = "https://api.binance.com/api/v3/ticker/price"
+# All supported symbols in one ticker request, e.g. ["BTCUSDT","ETHUSDT",...]
+BINANCE_SYMBOLS_PARAM = orjson.dumps(list(SUPPORTED_COINS.values())).decode()
+KGS_RATE_URL = "https://open.er-api.com/v6/latest/USD"
+
+# ---------- in-memory price cache ----------
+PRICE_REFRESH_INTERVAL = 10
+# Longer than the refresh interval so the background refresher keeps entries warm
+COIN_PRICE_TTL = 2 * PRICE_REFRESH_INTERVAL
+# open.er-api.com publishes a new rate once a day and rate-limits frequent
+# polling, so the KGS rate is refreshed hourly on its own schedule
+KGS_REFRESH_INTERVAL = 3600
+KGS_RATE_TTL = 2 * KGS_REFRESH_INTERVAL
+KGS_CACHE_KEY = "USDKGS"
+
+# key (Binance symbol or KGS_CACHE_KEY) -> (value, fetched_at on time.monotonic())
+_PRICE_CACHE: Dict[str, Tuple[float, float]] = {}
+
+def _cache_get(key: str, ttl: float) -> Optional[float]:
+    entry = _PRICE_CACHE.get(key)
+    if entry is not None and time.monotonic() - entry[1] < ttl:
+        return entry[0]
+    return None
+
+def _cache_put(key: str, value: float):
+    _cache_put_many({key: value})
+
+def _cache_put_many(values: Dict[str, float]):
+    now = time.monotonic()
+    for key, value in values.items():
+        _PRICE_CACHE[key] = (value, now)
+
+# ---------- persistent price cache (SQLite) ----------
+PRICE_DB_PATH = os.getenv("PRICE_DB_PATH", "prices.db")
+# Expired entries (e.g. loaded after a restart) are still served when upstream
+# fails, up to these ages. The KGS rate only changes once a day.
+STALE_PRICE_MAX_AGE = 600
+KGS_STALE_MAX_AGE = 24 * 3600
+_PRICE_DB: Optional[sqlite3.Connection] = None
+# Writes run in a worker thread (see _refresh_prices_forever); the lock keeps
+# close_price_db from closing the connection under an in-flight write
+_PRICE_DB_LOCK = threading.Lock()
+
+def open_price_db():
+    # Loads the prices persisted by the previous run so the cache starts warm
+    global _PRICE_DB
     try:
-        url = "https://open.er-api.com/v6/latest/USD"
-        r = requests.get(url, timeout=10)
-        r.raise_for_status()
-        data = r.json()
-        rates = data.get("rates", {})
-        for key in ["KGS", "kgs"]:
-            if key in rates:
-                return float(rates[key])
-        raise KeyError("Rate for KGS not found")
+        conn = sqlite3.connect(PRICE_DB_PATH, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        # No fsync per commit; losing the last writes of a cache on power loss is fine
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS prices(sym TEXT PRIMARY KEY, price REAL, ts REAL)")
+        rows = conn.execute("SELECT sym, price, ts FROM prices").fetchall()
+    except sqlite3.Error as e:
+        logger.error("Price DB unavailable, cache will not persist: %s", e)
+        return
+    _PRICE_DB = conn
+    # ts is wall-clock time; convert it to the monotonic clock the cache uses
+    offset = time.monotonic() - time.time()
+    for sym, price, ts in rows:
+        _PRICE_CACHE.setdefault(sym, (price, ts + offset))
+    logger.info("Loaded %d cached prices from %s", len(rows), PRICE_DB_PATH)
+
+def close_price_db():
+    global _PRICE_DB
+    with _PRICE_DB_LOCK:
+        if _PRICE_DB is not None:
+            _PRICE_DB.close()
+            _PRICE_DB = None
+
+def _price_rows() -> List[Tuple[str, float, float]]:
+    # Snapshot of the cache as (sym, price, wall-clock ts) rows; call on the event loop
+    offset = time.time() - time.monotonic()
+    return [(key, value, fetched_at + offset) for key, (value, fetched_at) in _PRICE_CACHE.items()]
+
+def _persist_prices(rows: List[Tuple[str, float, float]]):
+    # Blocking; run it off the event loop with asyncio.to_thread
+    with _PRICE_DB_LOCK:
+        if _PRICE_DB is None:
+            return
+        try:
+            with _PRICE_DB:
+                _PRICE_DB.executemany("INSERT OR REPLACE INTO prices(sym, price, ts) VALUES (?, ?, ?)", rows)
+        except sqlite3.Error as e:
+            logger.error("Error saving prices: %s", e)
+
+def _parse_kgs_rate(data: dict) -> float:
+    rates = data.get("rates", {})
+    for key in ["KGS", "kgs"]:
+        if key in rates:
+            return float(rates[key])
+    raise KeyError("Rate for KGS not found")
+
+# ---------- async HTTP (shared aiohttp session) ----------
+_HTTP_SESSION: Optional[aiohttp.ClientSession] = None
+
+def get_http_session() -> aiohttp.ClientSession:
+    # Created lazily so it binds to PTB's running event loop
+    global _HTTP_SESSION
+    if _HTTP_SESSION is None or _HTTP_SESSION.closed:
+        _HTTP_SESSION = aiohttp.ClientSession()
+    return _HTTP_SESSION
+
+async def close_http_session():
+    if _HTTP_SESSION is not None and not _HTTP_SESSION.closed:
+        await _HTTP_SESSION.close()
+
+# ---------- circuit breaker for upstream APIs ----------
+# After BREAKER_THRESHOLD consecutive failures an API is skipped for
+# BREAKER_COOLDOWN seconds, doubling on every further failure up to
+# BREAKER_MAX_COOLDOWN, so users are not kept waiting for timeouts.
+BREAKER_THRESHOLD = 3
+BREAKER_COOLDOWN = 30
+BREAKER_MAX_COOLDOWN = 300
+_BREAKER: Dict[str, Dict[str, float]] = {
+    "binance": {"fails": 0, "open_until": 0.0},
+    "erapi": {"fails": 0, "open_until": 0.0},
+}
+
+def _breaker_open(name: str) -> bool:
+    return time.monotonic() < _BREAKER[name]["open_until"]
+
+def _breaker_failure(name: str):
+    state = _BREAKER[name]
+    state["fails"] += 1
+    if state["fails"] >= BREAKER_THRESHOLD:
+        backoff = min(state["fails"] - BREAKER_THRESHOLD, 4)
+        cooldown = min(BREAKER_COOLDOWN * 2 ** backoff, BREAKER_MAX_COOLDOWN)
+        state["open_until"] = time.monotonic() + cooldown
+        logger.warning("%s is failing, skipping requests for %ds", name, cooldown)
+
+def _breaker_success(name: str):
+    state = _BREAKER[name]
+    state["fails"] = 0
+    state["open_until"] = 0.0
+
+# ---------- request coalescing ----------
+T = TypeVar("T")
+
+# key -> task of the upstream fetch currently in progress for that key
+_INFLIGHT: Dict[str, asyncio.Task] = {}
+
+def _singleflight(key: str, fetch: Callable[[], Awaitable[T]]) -> Awaitable[T]:
+    # Concurrent callers for the same key share one upstream request instead
+    # of each issuing their own. shield() keeps a cancelled caller from
+    # cancelling the fetch the other callers are waiting on.
+    task = _INFLIGHT.get(key)
+    if task is None:
+        task = asyncio.get_running_loop().create_task(fetch())
+        _INFLIGHT[key] = task
+        task.add_done_callback(lambda _: _INFLIGHT.pop(key, None))
+    return asyncio.shield(task)
+
+async def cancel_inflight_fetches():
+    # Shielded fetches outlive their callers; stop them before the HTTP session
+    # is closed so they do not fail (and trip the breaker) on a closed session
+    tasks = list(_INFLIGHT.values())
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+async def _fetch_usdt_to_kgs() -> Optional[float]:
+    if _breaker_open("erapi"):
+        return None
+    try:
+        timeout = aiohttp.ClientTimeout(total=10)
+        async with get_http_session().get(KGS_RATE_URL, timeout=timeout) as r:
+            r.raise_for_status()
+            rate = _parse_kgs_rate(await r.json(loads=orjson.loads))
+    except Exception as e:
+        logger.error("Error fetching USDT→KGS rate: %s", e)
+        _breaker_failure("erapi")
+        return None
+    _breaker_success("erapi")
+    _cache_put(KGS_CACHE_KEY, rate)
+    return rate
+
+async def _fetch_coin_price(pair: str) -> Optional[float]:
+    if _breaker_open("binance"):
+        return None
+    try:
+        timeout = aiohttp.ClientTimeout(total=5)
+        async with get_http_session().get(BINANCE_PRICE_URL, params={"symbol": pair}, timeout=timeout) as r:
+            r.raise_for_status()
+            price = float((await r.json(loads=orjson.loads))["price"])
     except Exception as e:
-        logging.error(f"Error fetching USDT→KGS rate: {e}")
+        logger.error("Error fetching %s price: %s", pair, e)
+        _breaker_failure("binance")
         return None
+    _breaker_success("binance")
+    _cache_put(pair, price)
+    return price
 
-def get_coin_price(coin: str) -> Optional[float]:
+async def _fetch_all_coin_prices() -> Optional[Dict[str, float]]:
+    if _breaker_open("binance"):
+        return None
     try:
-        pair = SUPPORTED_COINS[coin]
-        url = f"https://api.binance.com/api/v3/ticker/price?symbol={pair}"
-        r = requests.get(url, timeout=5)
-        r.raise_for_status()
-        return float(r.json()["price"])
+        timeout = aiohttp.ClientTimeout(total=5)
+        params = {"symbols": BINANCE_SYMBOLS_PARAM}
+        async with get_http_session().get(BINANCE_PRICE_URL, params=params, timeout=timeout) as r:
+            r.raise_for_status()
+            by_pair = {t["symbol"]: float(t["price"]) for t in await r.json(loads=orjson.loads)}
     except Exception as e:
-        logging.error(f"Error fetching {coin} price: {e}")
+        logger.error("Error fetching coin prices: %s", e)
+        _breaker_failure("binance")
         return None
+    _breaker_success("binance")
+    _cache_put_many(by_pair)
+    return by_pair
+
+class Quote(NamedTuple):
+    value: float
+    # True when upstream failed and an expired cache entry is served instead
+    stale: bool = False
+
+# Appended to any figure computed from an expired (stale) rate
+_STALE_NOTE = " (устаревший курс)"
+
+def _stale_quote(key: str, max_age: float = STALE_PRICE_MAX_AGE) -> Optional[Quote]:
+    value = _cache_get(key, max_age)
+    return Quote(value, stale=True) if value is not None else None
+
+async def get_usdt_to_kgs_async(max_age: float = KGS_RATE_TTL) -> Optional[Quote]:
+    cached = _cache_get(KGS_CACHE_KEY, max_age)
+    if cached is not None:
+        return Quote(cached)
+    rate = await _singleflight(KGS_CACHE_KEY, _fetch_usdt_to_kgs)
+    if rate is None:
+        return _stale_quote(KGS_CACHE_KEY, KGS_STALE_MAX_AGE)
+    return Quote(rate)
+
+async def get_coin_price_async(coin: str) -> Optional[Quote]:
+    pair = SUPPORTED_COINS.get(coin, coin)
+    cached = _cache_get(pair, COIN_PRICE_TTL)
+    if cached is not None:
+        return Quote(cached)
+    price = await _singleflight(pair, lambda: _fetch_coin_price(pair))
+    if price is None:
+        return _stale_quote(pair)
+    return Quote(price)
+
+async def get_all_coin_prices_async(max_age: float = COIN_PRICE_TTL) -> Dict[str, Quote]:
+    # Quotes for every supported coin, keyed by coin name; coins that could not
+    # be fetched are missing from the result.
+    cached = {coin: _cache_get(pair, max_age) for coin, pair in SUPPORTED_COINS.items()}
+    if all(price is not None for price in cached.values()):
+        return {coin: Quote(price) for coin, price in cached.items()}
+    by_pair = await _singleflight(BINANCE_SYMBOLS_PARAM, _fetch_all_coin_prices)
+    if by_pair is None:
+        stale = {coin: _stale_quote(pair) for coin, pair in SUPPORTED_COINS.items()}
+        return {coin: quote for coin, quote in stale.items() if quote is not None}
+    return {coin: Quote(by_pair[pair]) for coin, pair in SUPPORTED_COINS.items() if pair in by_pair}
+
+# ---------- background price refresher ----------
+_REFRESH_TASKS: List[asyncio.Task] = []
+
+async def _refresh_prices_forever():
+    # Keeps the Binance prices in _PRICE_CACHE warm so handlers are served from memory
+    while True:
+        try:
+            await get_all_coin_prices_async(max_age=0)
+            # Also saves prices fetched by handlers since the last tick
+            await asyncio.to_thread(_persist_prices, _price_rows())
+        except Exception as e:
+            logger.error("Price refresh failed: %s", e)
+        await asyncio.sleep(PRICE_REFRESH_INTERVAL)
+
+async def _refresh_kgs_rate_forever():
+    while True:
+        try:
+            # Skips the request when a recent rate was loaded from the price DB
+            await get_usdt_to_kgs_async(max_age=KGS_RATE_TTL - KGS_REFRESH_INTERVAL)
+        except Exception as e:
+            logger.error("KGS rate refresh failed: %s", e)
+        await asyncio.sleep(KGS_REFRESH_INTERVAL)
+
+def start_price_refresher():
+    loop = asyncio.get_running_loop()
+    _REFRESH_TASKS.append(loop.create_task(_refresh_prices_forever()))
+    _REFRESH_TASKS.append(loop.create_task(_refresh_kgs_rate_forever()))
+    logger.info(
+        "Started price refresher (coins every %ds, KGS every %ds)",
+        PRICE_REFRESH_INTERVAL, KGS_REFRESH_INTERVAL,
+    )
+
+async def stop_price_refresher():
+    for task in _REFRESH_TASKS:
+        task.cancel()
+    await asyncio.gather(*_REFRESH_TASKS, return_exceptions=True)
+    _REFRESH_TASKS.clear()
+
+# ---------- static reply texts (built once at import) ----------
+_COIN_LIST_LOWER = ", ".join(SUPPORTED_COINS)
+_COIN_LIST_UPPER = ", ".join(coin.upper() for coin in SUPPORTED_COINS)
+
+_CALC_USAGE_TEXT = (
+    "⚠️ Используй: /calc <монета> <количество>\n"
+    f"Поддерживаемые монеты: {_COIN_LIST_LOWER}"
+)
+_UNSUPPORTED_COIN_TEXT = f"⚠️ Поддерживаются только: {_COIN_LIST_LOWER}"
+
+_HELP_TEXT = (
+    "🤖 **Криптовалютный калькулятор**\n\n"
+    "**Команды:**\n"
+    "/calc <монета> <количество> - рассчитать в сомах\n"
+    "/rates - показать текущие курсы\n"
+    "/help - показать эту справку\n\n"
+    "**Поддерживаемые монеты:**\n"
+    f"{_COIN_LIST_UPPER}\n\n"
+    "**Примеры:**\n"
+    "`/calc btc 0.001`\n"
+    "`/calc eth 0.5`\n"
+    "`/calc ltc 2`"
+)
+
+_START_TEXT = (
+    "👋 Привет! Я помогу рассчитать стоимость криптовалют в сомах.\n\n"
+    "Используй /help для получения списка команд."
+)
 
 # --- Handlers (обязательно ДО main) ---
 async def calc(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if len(context.args) != 2:
-        await update.message.reply_text(
-            "⚠️ Используй: /calc <монета> <количество>\n"
-            f"Поддерживаемые монеты: {', '.join(SUPPORTED_COINS.keys())}"
-        )
+        await update.message.reply_text(_CALC_USAGE_TEXT)
         return
 
-    coin, amount_str = context.args[0].lower(), context.args[1]
+    coin, amount_str = context.args
+    # Keys are lowercase; only lowercase the argument when it is not already a key
     if coin not in SUPPORTED_COINS:
-        await update.message.reply_text(
-            f"⚠️ Поддерживаются только: {', '.join(SUPPORTED_COINS.keys())}"
-        )
+        coin = coin.lower()
+    if coin not in SUPPORTED_COINS:
+        await update.message.reply_text(_UNSUPPORTED_COIN_TEXT)
         return
 
     try:
@@ -98,134 +391,180 @@ async def calc(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     loading_msg = await update.message.reply_text("🔄 Получаю актуальные курсы...")
-    coin_price = get_coin_price(coin)
-    if coin_price is None:
+    # Both rates are independent, so fetch them concurrently
+    coin_quote, kgs_quote = await asyncio.gather(get_coin_price_async(coin), get_usdt_to_kgs_async())
+    if coin_quote is None:
         await loading_msg.edit_text("🚫 Не удалось получить курс монеты.")
         return
 
-    kgs_rate = get_usdt_to_kgs()
-    if kgs_rate is None:
+    if kgs_quote is None:
         await loading_msg.edit_text("🚫 Не удалось получить курс доллара к сому.")
         return
 
+    coin_price, kgs_rate = coin_quote.value, kgs_quote.value
     usdt_value = amount * coin_price
     total_kgs = usdt_value * kgs_rate
 
+    coin_upper = coin.upper()
+    coin_note = _STALE_NOTE if coin_quote.stale else ""
+    kgs_note = _STALE_NOTE if kgs_quote.stale else ""
+    total_note = _STALE_NOTE if coin_quote.stale or kgs_quote.stale else ""
     await loading_msg.edit_text(
-        f"💰 **Обмен {amount} {coin.upper()}**\n\n"
-        f"📊 Курс {coin.upper()}/USDT: `${coin_price:,.2f}`\n"
-        f"💵 Стоимость в USDT: `${usdt_value:,.2f}`\n"
-        f"🇰🇬 Курс USD/KGS: `{kgs_rate:.2f}`\n\n"
-        f"💸 **Итого: {total_kgs:,.2f} сом**",
+        f"💰 **Обмен {amount} {coin_upper}**\n\n"
+        f"📊 Курс {coin_upper}/USDT: `${coin_price:,.2f}`{coin_note}\n"
+        f"💵 Стоимость в USDT: `${usdt_value:,.2f}`{coin_note}\n"
+        f"🇰🇬 Курс USD/KGS: `{kgs_rate:.2f}`{kgs_note}\n\n"
+        f"💸 **Итого: {total_kgs:,.2f} сом**{total_note}",
         parse_mode='Markdown'
     )
 
 async def rates(update: Update, context: ContextTypes.DEFAULT_TYPE):
     loading_msg = await update.message.reply_text("🔄 Загружаю курсы...")
     rates_text = "📈 **Актуальные курсы криптовалют**\n\n"
-    for coin_symbol in SUPPORTED_COINS.keys():
-        price = get_coin_price(coin_symbol)
-        if price:
-            rates_text += f"{coin_symbol.upper()}: `${price:,.2f}`\n"
+    # One batched Binance request and the KGS request run concurrently
+    quotes, kgs_quote = await asyncio.gather(get_all_coin_prices_async(), get_usdt_to_kgs_async())
+    for coin_symbol in SUPPORTED_COINS:
+        quote = quotes.get(coin_symbol)
+        if quote:
+            note = _STALE_NOTE if quote.stale else ""
+            rates_text += f"{coin_symbol.upper()}: `${quote.value:,.2f}`{note}\n"
         else:
             rates_text += f"{coin_symbol.upper()}: ❌ недоступно\n"
 
-    kgs_rate = get_usdt_to_kgs()
-    if kgs_rate:
-        rates_text += f"\n💵 USD/KGS: `{kgs_rate:.2f}`"
+    if kgs_quote:
+        note = _STALE_NOTE if kgs_quote.stale else ""
+        rates_text += f"\n💵 USD/KGS: `{kgs_quote.value:.2f}`{note}"
 
     await loading_msg.edit_text(rates_text, parse_mode='Markdown')
 
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    help_text = (
-        "🤖 **Криптовалютный калькулятор**\n\n"
-        "**Команды:**\n"
-        "/calc <монета> <количество> - рассчитать в сомах\n"
-        "/rates - показать текущие курсы\n"
-        "/help - показать эту справку\n\n"
-        "**Поддерживаемые монеты:**\n"
-        f"{', '.join([coin.upper() for coin in SUPPORTED_COINS.keys()])}\n\n"
-        "**Примеры:**\n"
-        "`/calc btc 0.001`\n"
-        "`/calc eth 0.5`\n"
-        "`/calc ltc 2`"
-    )
-    await update.message.reply_text(help_text, parse_mode='Markdown')
+    await update.message.reply_text(_HELP_TEXT, parse_mode='Markdown')
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    await update.message.reply_text(
-        "👋 Привет! Я помогу рассчитать стоимость криптовалют в сомах.\n\n"
-        "Используй /help для получения списка команд."
-    )
+    await update.message.reply_text(_START_TEXT)
 
-# ---------- lightweight health HTTP server ----------
+# ---------- single HTTP server: health, metrics and webhook (aiohttp, on PTB's event loop) ----------
 START_TIME = time.time()
-_FAKE_REQUESTS = 0
-_FAKE_LOCK = threading.Lock()
-
-class HealthHandler(BaseHTTPRequestHandler):
-    def log_message(self, format, *args):
-        logging.info("%s - - [%s] %s", self.client_address[0], self.log_date_time_string(), format % args)
-
-    def do_GET(self):
-        global _FAKE_REQUESTS
-        if self.path in ("/", "/health"):
-            self.send_response(200)
-            self.send_header("Content-Type", "text/plain; charset=utf-8")
-            self.end_headers()
-            self.wfile.write(b"OK")
-        elif self.path == "/metrics":
-            uptime = time.time() - START_TIME
-            with _FAKE_LOCK:
-                fake = _FAKE_REQUESTS
-            payload = {"uptime_seconds": int(uptime), "fake_requests": fake}
-            self.send_response(200)
-            self.send_header("Content-Type", "application/json; charset=utf-8")
-            self.end_headers()
-            self.wfile.write(json.dumps(payload).encode("utf-8"))
-        else:
-            self.send_response(404)
-            self.end_headers()
+_REAL_REQUESTS = 0
+_WEB_RUNNER: Optional[web.AppRunner] = None
 
-def start_health_server():
-    port = int(os.getenv("PORT", "8000"))
-    server = HTTPServer(("0.0.0.0", port), HealthHandler)
-    thread = threading.Thread(target=server.serve_forever, daemon=True)
-    thread.start()
-    logging.info("Health server started on 0.0.0.0:%d", port)
-    return server
+# Telegram pushes updates to PUBLIC_URL + WEBHOOK_PATH. Render provides
+# RENDER_EXTERNAL_URL; without a public URL the bot falls back to polling.
+PUBLIC_URL = (os.getenv("PUBLIC_URL") or os.getenv("RENDER_EXTERNAL_URL") or "").rstrip("/")
+WEBHOOK_PATH = "/telegram"
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET") or secrets.token_urlsafe(32)
+BOT_APP_KEY = web.AppKey("bot_app", Application)
+
+# Response bodies are pre-encoded once
+_OK_BODY = b"OK"
+_METRICS_BODY = b'{"uptime_seconds":%d,"real_requests":%d}'
+
+@web.middleware
+async def count_requests(request: web.Request, handler):
+    global _REAL_REQUESTS
+    _REAL_REQUESTS += 1
+    return await handler(request)
+
+async def health(request: web.Request) -> web.Response:
+    return web.Response(body=_OK_BODY, content_type="text/plain", charset="utf-8")
+
+async def metrics(request: web.Request) -> web.Response:
+    body = _METRICS_BODY % (int(time.time() - START_TIME), _REAL_REQUESTS)
+    return web.Response(body=body, content_type="application/json", charset="utf-8")
+
+async def telegram_webhook(request: web.Request) -> web.Response:
+    # Compared as bytes: compare_digest rejects non-ASCII str, which a client could send
+    token = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "").encode()
+    if not secrets.compare_digest(token, WEBHOOK_SECRET.encode()):
+        return web.Response(status=403)
+    application = request.app[BOT_APP_KEY]
+    try:
+        update = Update.de_json(await request.json(loads=orjson.loads), application.bot)
+    except Exception as e:
+        logger.error("Bad webhook payload: %s", e)
+        return web.Response(status=400)
+    await application.update_queue.put(update)
+    return web.Response()
 
-def start_fake_traffic(interval_seconds: int = 25):
+async def start_web_server(application: Application):
+    global _WEB_RUNNER
     port = int(os.getenv("PORT", "8000"))
-    def loop():
-        global _FAKE_REQUESTS
-        url = f"http://127.0.0.1:{port}/"
-        while True:
-            try:
-                requests.get(url, timeout=5)
-                with _FAKE_LOCK:
-                    _FAKE_REQUESTS += 1
-            except Exception as e:
-                logging.debug("Fake traffic request failed: %s", e)
-            time.sleep(interval_seconds)
-    t = threading.Thread(target=loop, daemon=True)
-    t.start()
-    logging.info("Started fake traffic thread (every %ds) to localhost:%d", interval_seconds, port)
+    web_app = web.Application(middlewares=[count_requests])
+    web_app[BOT_APP_KEY] = application
+    web_app.router.add_get("/", health)
+    web_app.router.add_get("/health", health)
+    web_app.router.add_get("/metrics", metrics)
+    if PUBLIC_URL:
+        web_app.router.add_post(WEBHOOK_PATH, telegram_webhook)
+    _WEB_RUNNER = web.AppRunner(web_app)
+    await _WEB_RUNNER.setup()
+    await web.TCPSite(_WEB_RUNNER, "0.0.0.0", port).start()
+    logger.info("Web server started on 0.0.0.0:%d", port)
+
+async def stop_web_server():
+    global _WEB_RUNNER
+    if _WEB_RUNNER is not None:
+        await _WEB_RUNNER.cleanup()
+        _WEB_RUNNER = None
 
 # ---------- main ----------
+async def run_bot(application: Application):
+    # The web server binds PORT before application.initialize() calls Telegram's
+    # getMe, so a slow Telegram API does not delay Render's port check. Web
+    # server, refresher and bot all share this one event loop.
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:
+            pass  # e.g. Windows; Ctrl+C still cancels asyncio.run()
+
+    await start_web_server(application)
+    open_price_db()
+    start_price_refresher()
+    try:
+        async with application:
+            try:
+                if PUBLIC_URL:
+                    # Updates arrive via POST /telegram on our own web server
+                    await application.bot.set_webhook(
+                        url=PUBLIC_URL + WEBHOOK_PATH,
+                        secret_token=WEBHOOK_SECRET,
+                        # Only commands are handled; this also resets any wider
+                        # subscription Telegram remembers from earlier runs
+                        allowed_updates=[Update.MESSAGE],
+                    )
+                    logger.info("Webhook set to %s%s", PUBLIC_URL, WEBHOOK_PATH)
+                else:
+                    await application.updater.start_polling()
+                await application.start()
+                await stop.wait()
+            finally:
+                if application.updater is not None and application.updater.running:
+                    await application.updater.stop()
+                if application.running:
+                    await application.stop()
+    finally:
+        await stop_price_refresher()
+        await stop_web_server()
+        await cancel_inflight_fetches()
+        await close_http_session()
+        close_price_db()
+
 def main():
     if not TOKEN:
-        print("❌ Error: BOT_TOKEN not found!")
-        print("1) export BOT_TOKEN='your_bot_token'")
-        print("2) or create .env with BOT_TOKEN=your_bot_token")
+        logger.error(
+            "BOT_TOKEN not found! Either export BOT_TOKEN='your_bot_token' "
+            "or create .env with BOT_TOKEN=your_bot_token"
+        )
         return
 
-    # Start health server BEFORE starting the bot
-    start_health_server()
-    # start fake requests (optional)
-    start_fake_traffic(interval_seconds=30)
-
-    app = Application.builder().token(TOKEN).build()
+    builder = Application.builder().token(TOKEN)
+    if PUBLIC_URL:
+        # No getUpdates loop in webhook mode
+        builder = builder.updater(None)
+    app = builder.build()
 
     # Now handlers can be added because they are defined above
     app.add_handler(CommandHandler("start", start))
@@ -233,14 +572,13 @@ def main():
     app.add_handler(CommandHandler("rates", rates))
     app.add_handler(CommandHandler("help", help_command))
 
-    logging.info("python-telegram-bot version: %s", telegram.__version__)
-    print("🚀 Bot starting...")
+    logger.info("python-telegram-bot version: %s", telegram.__version__)
+    logger.info("Bot starting in %s mode", "webhook" if PUBLIC_URL else "polling")
 
     try:
-        app.run_polling()
+        asyncio.run(run_bot(app))
     except Exception as e:
-        logging.error(f"Failed to start bot: {e}")
-        print(f"❌ Failed to start bot: {e}")
+        logger.error("Failed to start bot: %s", e)
 
 if __name__ == "__main__":
     main()